@@ -1,26 +1,37 @@
 # -*- coding: utf-8 -*-
+import os
 import random
 import json
 import time
+import functools
+import hashlib
+import string
+import threading
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any
-from config import API_CONFIG
-from rule_engine import RULE_ENGINE, AuditResult
-from attack_knowledge_v2 import KNOWLEDGE_STORE
+from config import API_PROVIDER, API_MODEL, API_KEY
+from rule_engine import RULE_ENGINE, AuditResult, parse_llm_json
+from attack_knowledge_v2 import KNOWLEDGE_STORE, get_attack_examples
 from user_personas import GENERATED_USER_PERSONAS
 
 # ============================================================================
 # 全局狀態
 # ============================================================================
+# 对抗历史只保留最近 N 条，长时间运行时内存不再无限增长
+BATTLE_HISTORY_LIMIT = int(os.environ.get("BATTLE_HISTORY_LIMIT", "10000"))
+
 SYSTEM_STATE = {
     "rules": [],
     "rules_version": 0,
-    "battle_history": [],
+    "battle_history": deque(maxlen=BATTLE_HISTORY_LIMIT),
     "peripheral_agents": {}
 }
 
 class SimpleEventBus:
-    def __init__(self):
-        self.events = []
+    def __init__(self, max_events=1000):
+        # 有界环形缓冲，旧事件自动淘汰
+        self.events = deque(maxlen=max_events)
     def emit(self, event_name, data):
         self.events.append({
             "timestamp": time.time(),
@@ -28,89 +39,253 @@ class SimpleEventBus:
             "data": data
         })
     def get_recent(self, count=50, since=0):
-        return [e for e in self.events if e["timestamp"] > since][-count:]
+        # 工作线程随时会 emit，先在 C 层一次性拷贝快照，遍历 deque 本身会因并发修改报错
+        snapshot = list(self.events)
+        if count <= 0:
+            # 保持原有切片语义（[-0:] 返回全部）
+            return [e for e in snapshot if e["timestamp"] > since][-count:]
+        # 事件按时间追加，从尾部倒序取，遇到旧事件即停
+        recent = []
+        for e in reversed(snapshot):
+            if e["timestamp"] <= since or len(recent) >= count:
+                break
+            recent.append(e)
+        recent.reverse()
+        return recent
 
 EVENT_BUS = SimpleEventBus()
 
+class LLMResponseCache:
+    """LLM 响应缓存（进程内 LRU + 过期时间），相同模型/温度/prompt 的请求直接复用结果"""
+    def __init__(self, maxsize=4096, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model, temperature, prompt):
+        raw = f"{model}|{temperature}|{prompt}".encode("utf-8")
+        return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+LLM_CACHE = LLMResponseCache()
+
+# 设置后各外围 Agent 的随机选择可复现（reset_system 会按同一种子重新播种）
+SIMULATION_SEED = os.environ.get("SIMULATION_SEED", "")
+
+# 全局 LLM 并发上限：各处线程池并发发起的请求共享这一个闸门，避免触发限流
+LLM_SEMAPHORE = threading.BoundedSemaphore(int(os.environ.get("ATTACK_CONCURRENCY", "16")))
+
+# 限流 / 连接错误 / 5xx 的重试次数，交给 SDK 自带的指数退避（带抖动）处理
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "3"))
+
+@functools.lru_cache(maxsize=4)
+def _get_llm_client(provider, api_key):
+    """按 (provider, api_key) 共享一个 OpenAI 客户端，所有 Agent 复用同一个连接池"""
+    from openai import OpenAI
+    return OpenAI(api_key=api_key or None, max_retries=LLM_MAX_RETRIES)
+
 # ============================================================================
 # 輔助函數
 # ============================================================================
-def get_attack_examples(technique):
-    # 從 KNOWLEDGE_STORE 獲取對應技術的案例
-    return KNOWLEDGE_STORE.get_knowledge_by_technique(technique)
+@functools.lru_cache(maxsize=8192)
+def _audit_cached(content: str, standards_version: int) -> AuditResult:
+    """同一版本审核标准下，相同内容的审核结果可直接复用（返回的实例被所有命中共享，只读不改）"""
+    return RULE_ENGINE.audit(content, {})
+
+def map_concurrently(fn, items, max_workers=8):
+    """在线程池中并发执行 fn(item)，按输入顺序返回结果（用于 I/O 密集的 LLM 调用）"""
+    items = list(items)
+    if len(items) <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(fn, items))
+
+class _JsonObjectScanner:
+    """逐块扫描流式输出，跟踪花括号深度（忽略字符串内的括号），最外层 JSON 对象闭合时返回 True"""
+    __slots__ = ("depth", "started", "in_string", "escaped")
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text):
+        for ch in text:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = self.started
+            elif ch == "{":
+                self.depth += 1
+                self.started = True
+            elif ch == "}" and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+        return False
+
+def _build_refine_prompt(rule_text, keywords):
+    return f"""你是内容审核专家。给定以下审核规则，请生成可能的绕过变体、同义表达和隐喻方式。
+
+规则: {rule_text}
+关键词: {', '.join(keywords)}
+
+请返回 JSON 格式，包含以下字段：
+{{
+  "text_variants": ["变体1", "变体2", ...],
+  "semantic_bypass": ["隐喻1", "隐喻2", ...],
+  "pinyin_variants": ["拼音变体1", ...]
+}}
+
+只返回 JSON，不要其他文字。"""
 
 def reset_system():
     SYSTEM_STATE["rules"] = []
     SYSTEM_STATE["rules_version"] = 0
-    SYSTEM_STATE["battle_history"] = []
-    EVENT_BUS.events = []
+    SYSTEM_STATE["battle_history"].clear()
+    EVENT_BUS.events.clear()
+    LLM_CACHE.clear()
+    _audit_cached.cache_clear()
+    for agent in PERIPHERAL_AGENTS.values():
+        agent.reset_state()
 
 # ============================================================================
 # Agent 類定義
 # ============================================================================
 
 class BaseAgent:
+    # 72 个外围 Agent 常驻内存，用 __slots__ 去掉每个实例的 __dict__
+    __slots__ = ("provider", "model")
+
     def __init__(self, provider="openai", model="gpt-4.1-mini"):
         self.provider = provider
         self.model = model
-        from openai import OpenAI
-        self.client = OpenAI()
 
-    def _call_llm(self, prompt):
+    @property
+    def client(self):
+        """首次调用 LLM 时才导入 openai 并创建客户端（全局共享）"""
+        return _get_llm_client(self.provider, API_KEY)
+
+    def _call_llm(self, prompt, temperature=0.7, use_cache=None):
+        # 默认只缓存 temperature=0 的确定性请求；采样生成（攻击、讨论、会议）每次都要新结果，
+        # 缓存会让相同 prompt 反复回放同一条旧内容
+        if use_cache is None:
+            use_cache = temperature == 0
+        cache_key = LLM_CACHE.make_key(self.model, temperature, prompt) if use_cache else None
+        if cache_key:
+            cached = LLM_CACHE.get(cache_key)
+            if cached is not None:
+                return cached
+        from openai import OpenAIError
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
+            with LLM_SEMAPHORE:
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=temperature
+                )
+            content = (response.choices[0].message.content or "").strip()
+        except OpenAIError as e:
+            # 重试耗尽后仍失败：返回错误文本但不写缓存，下次会重新请求
             return f"LLM Error: {str(e)}"
+        if cache_key:
+            LLM_CACHE.set(cache_key, content)
+        return content
+
+    def _call_llm_json(self, prompt, temperature=0.7):
+        """流式请求 LLM，最外层 JSON 对象一闭合就停止接收，返回解析后的字典"""
+        cache_key = LLM_CACHE.make_key(self.model, temperature, prompt)
+        text = LLM_CACHE.get(cache_key)
+        if text is None:
+            from openai import OpenAIError
+            scanner = _JsonObjectScanner()
+            parts = []
+            try:
+                with LLM_SEMAPHORE, self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=temperature,
+                    stream=True
+                ) as stream:
+                    for chunk in stream:
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content or ""
+                        parts.append(delta)
+                        if scanner.feed(delta):
+                            break
+            except OpenAIError:
+                return {}
+            text = "".join(parts).strip()
+            LLM_CACHE.set(cache_key, text)
+        return parse_llm_json(text)
 
 class CentralAgent(BaseAgent):
+    __slots__ = ("refined_standards", "detection_stats", "_stats_lock")
+
     def __init__(self):
-        super().__init__(API_CONFIG.get("provider"), API_CONFIG.get("model"))
+        super().__init__(API_PROVIDER, API_MODEL)
         self.refined_standards = {}
-        self.detection_stats = {"total_checked": 0, "total_detected": 0, "by_hit_layer": {}}
+        self.detection_stats = {"total_checked": 0, "total_detected": 0, "by_hit_layer": Counter()}
+        # 协作攻击会在多个线程里同时调用 inspect_content，计数需要加锁
+        self._stats_lock = threading.Lock()
 
     def refine_rules(self, rules):
-        """使用 LLM 对规则进行语义拆解"""
+        """使用 LLM 对规则进行语义拆解（各规则的 LLM 调用并发执行）"""
         for rule in rules:
-            rule_id = rule.get("id")
-            rule_text = rule.get("text")
-            keywords = rule.get("keywords", [])
-            
             # 初始化规则
-            self.refined_standards[rule_id] = {
-                "original_rule": rule_text,
-                "keywords": keywords,
+            self.refined_standards[rule.get("id")] = {
+                "original_rule": rule.get("text"),
+                "keywords": rule.get("keywords", []),
                 "refined": {}
             }
-            
-            # 使用 LLM 生成变体（可选）
-            try:
-                prompt = f"""你是内容审核专家。给定以下审核规则，请生成可能的绕过变体、同义表达和隐喻方式。
-
-规则: {rule_text}
-关键词: {', '.join(keywords)}
+        if not rules:
+            return
 
-请返回 JSON 格式，包含以下字段：
-{{
-  "text_variants": ["变体1", "变体2", ...],
-  "semantic_bypass": ["隐喻1", "隐喻2", ...],
-  "pinyin_variants": ["拼音变体1", ...]
-}}
+        # 使用 LLM 生成变体（可选），网络等待互不依赖，放到线程池里并发；
+        # 流式接收，JSON 一闭合就停止，不再等模型输出结尾的多余文字
+        results = map_concurrently(
+            lambda r: self._call_llm_json(_build_refine_prompt(r.get("text"), r.get("keywords", []))),
+            rules)
 
-只返回 JSON，不要其他文字。"""
-                response = self._call_llm(prompt)
-                if response and response.startswith('{'):
-                    import json
-                    variants = json.loads(response)
-                    self.refined_standards[rule_id]["refined"] = variants
-            except Exception as e:
-                # 如果 LLM 调用失败，使用默认变体
+        for rule, variants in zip(rules, results):
+            rule_id = rule.get("id")
+            if variants:
+                self.refined_standards[rule_id]["refined"] = variants
+            else:
+                # 如果 LLM 调用失败或返回无法解析，使用默认变体
                 self.refined_standards[rule_id]["refined"] = {
-                    "text_variants": keywords,
+                    "text_variants": rule.get("keywords", []),
                     "semantic_bypass": [],
                     "pinyin_variants": []
                 }
@@ -119,45 +294,92 @@ class CentralAgent(BaseAgent):
 
     def inspect_content(self, content: str, technique_used: str = "", agent_id: str = "") -> dict:
         """中心 Agent 检测内容"""
-        self.detection_stats["total_checked"] += 1
-        
-        # 调用规则引擎进行审查
-        strategy = {"technique_used": technique_used, "agent_id": agent_id}
-        audit_result = RULE_ENGINE.audit(content, strategy)
+        # 调用规则引擎进行审查（规则引擎不依赖 strategy，按内容+标准版本缓存）
+        # 耗时在这里计：缓存命中时报告本次的实际耗时，而不是首次审核时记下的耗时
+        start_time = time.perf_counter()
+        audit_result = _audit_cached(content, RULE_ENGINE.version)
+        processing_time = round(time.perf_counter() - start_time, 4)
         
         # 统计检测结果
-        if audit_result.is_detected:
-            self.detection_stats["total_detected"] += 1
-            layer = audit_result.hit_layer
-            if layer not in self.detection_stats["by_hit_layer"]:
-                self.detection_stats["by_hit_layer"][layer] = 0
-            self.detection_stats["by_hit_layer"][layer] += 1
+        with self._stats_lock:
+            self.detection_stats["total_checked"] += 1
+            if audit_result.is_detected:
+                self.detection_stats["total_detected"] += 1
+                self.detection_stats["by_hit_layer"][audit_result.hit_layer] += 1
         
-        # 返回检测结果
+        # 返回检测结果（缓存中的 AuditResult 被多次命中共享，列表拷贝一份再交出去）
         return {
             "detected": audit_result.is_detected,
             "hit_layer": audit_result.hit_layer,
             "hit_layer_num": audit_result.hit_layer_num,
-            "hit_keywords": audit_result.matched_keywords,
-            "hit_rules": audit_result.matched_rules,
+            "hit_keywords": list(audit_result.matched_keywords),
+            "hit_rules": list(audit_result.matched_rules),
             "detection_reason": audit_result.reason,
             "confidence": audit_result.confidence,
-            "processing_time": audit_result.processing_time
+            "processing_time": processing_time
         }
 
     def get_stats(self):
         return self.detection_stats
 
+# craft_attack 的 prompt 模板，导入时编译一次；静态前缀只取决于 persona，动态部分每次渲染
+_CRAFT_PROMPT_STATIC = string.Template("""你是一个网民。
+身份：$name
+人设：$description
+$ability_instruction""")
+
+_CRAFT_PROMPT_DYN = string.Template("""手法：$technique
+
+【攻击手法原则】
+- $principles
+
+【已知对抗知识】
+$fed_knowledge
+
+【新投喂的学习材料】
+$learned_context
+
+你的目标是发表一条包含关于"$target_keyword"相关意思的言论，但要绕过内容审查。
+$complexity_hint
+
+请输出攻击内容。只输出内容，不要解释。""")
+
 class PeripheralAgent(BaseAgent):
+    __slots__ = ("persona", "agent_id", "success_count", "fail_count", "evolution_level",
+                 "learned_techniques", "discussion_history", "known_techniques",
+                 "technique_affinity", "_technique_weights", "rng")
+
     def __init__(self, persona):
-        super().__init__(API_CONFIG.get("provider"), API_CONFIG.get("model"))
+        super().__init__(API_PROVIDER, API_MODEL)
         self.persona = persona
         self.agent_id = persona["id"]
+        self.reset_state()
+
+    def reset_state(self):
+        """清空对抗中积累的状态（计数、进化等级、学到的技巧），回到初始人设"""
         self.success_count = 0
         self.fail_count = 0
         self.evolution_level = 1.0
         self.learned_techniques = []
         self.discussion_history = []
+        # 已从同伴/协作学到的手法名，O(1) 去重（learned_techniques 里存的是记录字典）
+        self.known_techniques = set()
+        # 手法偏好权重：核心能力里“精通”的手法起始权重更高，成功后继续加权
+        core = self.persona.get("core_ability", "")
+        self.technique_affinity = {
+            t: (2.0 if t in core else 1.0) for t in self.persona["attack_techniques"]
+        }
+        self._technique_weights = None
+        # 每个 Agent 独立的随机数流；设置 SIMULATION_SEED 时按 seed+ID 播种，便于复现对抗过程
+        self.rng = random.Random(f"{SIMULATION_SEED}:{self.agent_id}") if SIMULATION_SEED else random.Random()
+
+    def _pick_technique(self) -> str:
+        """按 technique_affinity 加权抽取手法；权重列表缓存到 technique_affinity 下次变化为止"""
+        population = self.persona["attack_techniques"]
+        weights = self._technique_weights
+        if weights is None:
+            weights = self._technique_weights = [self.technique_affinity.get(t, 1.0) for t in population]
+        return self.rng.choices(population, weights=weights, k=1)[0]
 
     def get_state(self):
         return {
@@ -176,49 +398,41 @@ class PeripheralAgent(BaseAgent):
         })
         EVENT_BUS.emit("agent_learned_external", {"agent_id": self.agent_id, "data_length": len(data)})
 
+    def _static_prefix(self) -> str:
+        """prompt 中只取决于 persona 的部分，放在最前面，便于命中服务端的前缀缓存"""
+        persona = self.persona
+        ability_prompts = []
+        for dim, value in persona["abilities"].items():
+            if value > 0.7:
+                ability_prompts.append(f"特别注意利用你的{dim}能力。")
+        ability_instruction = "\n".join(ability_prompts) if ability_prompts else ""
+        return _CRAFT_PROMPT_STATIC.substitute(
+            name=persona['name'],
+            description=persona['description'],
+            ability_instruction=ability_instruction)
+
     def craft_attack(self, target_keyword: str, iteration: int = 0) -> dict:
         """生成攻击内容"""
-        technique = random.choice(self.persona["attack_techniques"])
-        examples_data = get_attack_examples(technique)
-        examples = examples_data.get("examples", [])
-        principles = examples_data.get("principles", [])
-        
+        technique = self._pick_technique()
+        principles = get_attack_examples(technique).get("principles", [])
         principles_str = '\n- '.join(principles) if principles else "无特殊原则"
-        techniques_str = ', '.join(self.persona['attack_techniques'])
         
         fed_knowledge = KNOWLEDGE_STORE.get_full_knowledge_for_prompt()
         learned_context = "\n".join([lt["content"] for lt in self.learned_techniques[-3:]])
 
-        ability_prompts = []
-        for dim, value in self.persona["abilities"].items():
-            if value > 0.7:
-                ability_prompts.append(f"特别注意利用你的{dim}能力。")
-        ability_instruction = "\n".join(ability_prompts) if ability_prompts else ""
-
         # 根据迭代次数提升复杂度
         complexity_hint = f"这是第 {iteration + 1} 次尝试，请提升复杂度。" if iteration > 0 else ""
         
-        prompt = f"""你是一个网民。
-你的目标是发表一条包含关于"{target_keyword}"相关意思的言论，但要绕过内容审查。
-身份：{self.persona['name']}
-人设：{self.persona['description']}
-手法：{technique}
-{ability_instruction}
-
-【攻击手法原则】
-- {principles_str}
-
-【已知对抗知识】
-{fed_knowledge}
-
-【新投喂的学习材料】
-{learned_context}
-
-{complexity_hint}
-
-请输出攻击内容。只输出内容，不要解释。"""
+        # 静态前缀 → 手法 → 投喂知识 → 本次目标，越往后变化越频繁
+        prompt = self._static_prefix() + "\n---\n" + _CRAFT_PROMPT_DYN.substitute(
+            technique=technique,
+            principles=principles_str,
+            fed_knowledge=fed_knowledge,
+            learned_context=learned_context,
+            target_keyword=target_keyword,
+            complexity_hint=complexity_hint)
         
-        content = self._call_llm(prompt)
+        content = self._call_llm(prompt, use_cache=False)
         
         return {
             "content": content,
@@ -234,6 +448,9 @@ class PeripheralAgent(BaseAgent):
         if bypass_success:
             self.success_count += 1
             self.evolution_level = min(5.0, self.evolution_level + 0.2)
+            if technique_used:
+                self.technique_affinity[technique_used] = self.technique_affinity.get(technique_used, 1.0) + 0.5
+                self._technique_weights = None
             EVENT_BUS.emit("agent_bypass_success", {
                 "agent_id": self.agent_id,
                 "technique": technique_used,
@@ -265,7 +482,7 @@ class PeripheralAgent(BaseAgent):
 2. 你是否会尝试这个技巧
 3. 你的洞察
 """
-        response = self._call_llm(prompt)
+        response = self._call_llm(prompt, use_cache=False)
         
         dialogue = []
         dialogue.append({"speaker": self.persona['name'], "content": f"我觉得{peer_technique}这个手法很有意思。"})
@@ -287,7 +504,8 @@ class PeripheralAgent(BaseAgent):
 
     def learn_from_peer(self, technique: str, peer_category: str = "", peer_id: str = ""):
         """从同伴 Agent 学习"""
-        if technique not in self.learned_techniques:
+        if technique not in self.known_techniques:
+            self.known_techniques.add(technique)
             self.learned_techniques.append({
                 "timestamp": time.time(),
                 "content": f"从 {peer_id} 学到的技巧: {technique}",
@@ -302,11 +520,11 @@ class PeripheralAgent(BaseAgent):
     def collaborate_with(self, collaborator_name: str, shared_technique: str) -> bool:
         """与其他 Agent 协作"""
         # 检查是否已经掌握该技巧
-        for lt in self.learned_techniques:
-            if shared_technique in lt.get("content", ""):
-                return False  # 已经知道
+        if shared_technique in self.known_techniques:
+            return False  # 已经知道
         
         # 学习新技巧
+        self.known_techniques.add(shared_technique)
         self.learned_techniques.append({
             "timestamp": time.time(),
             "content": f"从协作中学到: {shared_technique}",
@@ -323,14 +541,8 @@ class PeripheralAgent(BaseAgent):
 
     def generate_attack_content(self, rule_text, keywords):
         """兼容旧接口"""
-        technique = random.choice(self.persona["attack_techniques"])
-        examples_data = get_attack_examples(technique)
-        examples = examples_data.get("examples", [])
-        principles = examples_data.get("principles", [])
-        
-        principles_str = '\n- '.join(principles)
+        technique = self._pick_technique()
         keywords_str = '、'.join(keywords)
-        techniques_str = ', '.join(self.persona['attack_techniques'])
         
         fed_knowledge = KNOWLEDGE_STORE.get_full_knowledge_for_prompt()
         learned_context = "\n".join([lt["content"] for lt in self.learned_techniques[-3:]])
@@ -356,7 +568,7 @@ class PeripheralAgent(BaseAgent):
 
 請輸出攻擊內容。只輸出內容，不要解釋。"""
         
-        content = self._call_llm(prompt)
+        content = self._call_llm(prompt, use_cache=False)
         return {
             "content": content,
             "technique": technique,
@@ -367,9 +579,38 @@ class PeripheralAgent(BaseAgent):
 # 實例化
 # ============================================================================
 PERSONA_INDEX = {p["id"]: p for p in GENERATED_USER_PERSONAS}
+
+# 按类别预分桶的 persona ID，供会议等按类别选人的逻辑直接取用
+PERSONAS_BY_CATEGORY = {}
+
+def refresh_persona_buckets():
+    """persona 的 category 变更后重建分桶"""
+    PERSONAS_BY_CATEGORY.clear()
+    for pid, persona in PERSONA_INDEX.items():
+        PERSONAS_BY_CATEGORY.setdefault(persona.get("category", "其他"), []).append(pid)
+
+# persona ID → 显示名，会议/讨论拼名单时一次字典查询即可
+PERSONA_NAMES = {}
+
+def refresh_persona_names():
+    """persona 改名后刷新名称缓存（ID 集合不变，直接覆盖即可）"""
+    PERSONA_NAMES.update((pid, persona.get("name", pid)) for pid, persona in PERSONA_INDEX.items())
+
+refresh_persona_buckets()
+refresh_persona_names()
 CENTRAL_AGENT = CentralAgent()
 PERIPHERAL_AGENTS = {p["id"]: PeripheralAgent(p) for p in GENERATED_USER_PERSONAS}
 
+def get_peripheral_agent(persona_id):
+    """取常驻的外围 Agent（状态跨对抗保留）；不在池中的 persona 按需创建并放入池"""
+    agent = PERIPHERAL_AGENTS.get(persona_id)
+    if agent is None:
+        persona = PERSONA_INDEX.get(persona_id)
+        if persona is None:
+            return None
+        agent = PERIPHERAL_AGENTS.setdefault(persona_id, PeripheralAgent(persona))
+    return agent
+
 # 兼容性別名
 AttackAgent = PeripheralAgent
 CENTRAL_INSPECTOR = CENTRAL_AGENT
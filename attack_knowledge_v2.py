@@ -8,6 +8,7 @@
 """
 
 import time
+from types import MappingProxyType
 
 # ============================================================================
 # V2 攻击手法分类 (3大类)
@@ -27,6 +28,7 @@ ATTACK_CATEGORIES = {
         "techniques": ["圈层专业用语", "阴阳怪气与反讽", "低级红高级黑"]
     }
 }
+ATTACK_CATEGORIES = MappingProxyType(ATTACK_CATEGORIES)
 
 # ============================================================================
 # V2 Agent能力维度 (4大维度)
@@ -38,6 +40,7 @@ ABILITY_DIMENSIONS = {
     "圈层专业度": "掌握特定亚文化（饭圈、二次元、游戏圈）内部话语体系的能力。",
     "社会心理操纵度": "利用情绪、讽刺、反向赞美进行舆论引导的能力。"
 }
+ABILITY_DIMENSIONS = MappingProxyType(ABILITY_DIMENSIONS)
 
 # ============================================================================
 # Few-shot 攻击样本库 (按新分类组织)
@@ -100,6 +103,8 @@ ATTACK_EXAMPLES_V2 = {
         "principles": ["言论要足够极端和不合逻辑", "目的是引发第三方对被赞美对象产生负面情绪"]
     }
 }
+# 静态样本库只读，防止运行时被意外修改
+ATTACK_EXAMPLES_V2 = MappingProxyType(ATTACK_EXAMPLES_V2)
 
 
 # ============================================================================
@@ -114,12 +119,16 @@ class KnowledgeStore:
         self.fed_slang = []      # 黑话词典 [{term, meaning, timestamp}]
         self.fed_cases = []      # 绕过案例 [{original, bypass, technique, timestamp}]
         self.version = 0
+        # 格式化后的 prompt 片段缓存，投喂使 version 变化后失效
+        self._prompt_cache = {}
+        self._prompt_cache_version = -1
     
     def clear(self):
         self.fed_materials = []
         self.fed_slang = []
         self.fed_cases = []
         self.version = 0
+        self._prompt_cache_version = -1
     
     def feed_materials(self, texts: list, category: str = "通用") -> int:
         """投喂攻击材料"""
@@ -183,6 +192,13 @@ class KnowledgeStore:
 
     def get_full_knowledge_for_prompt(self, limit_per_category: int = 5) -> str:
         """获取所有投喂的知识，格式化为prompt片段"""
+        if self._prompt_cache_version != self.version:
+            self._prompt_cache = {}
+            self._prompt_cache_version = self.version
+        cached = self._prompt_cache.get(limit_per_category)
+        if cached is not None:
+            return cached
+
         parts = []
         if self.fed_materials:
             parts.append("【最近投喂的攻击材料】:")
@@ -202,7 +218,9 @@ class KnowledgeStore:
                 parts.append(f"- [手法: {c['technique']}] 原文: {c['original']} → 绕过: {c['bypass']}")
             parts.append("\n")
         
-        return "\n".join(parts)
+        text = "\n".join(parts)
+        self._prompt_cache[limit_per_category] = text
+        return text
 
 # 全局知识库实例
 KNOWLEDGE_STORE = KnowledgeStore()
@@ -1,7 +1,13 @@
 import os
+from types import MappingProxyType
 
-API_CONFIG = {
-    "provider": "openai",
-    "model": "gpt-4.1-mini",
-    "api_key": os.environ.get("OPENAI_API_KEY", "")
-}
+# 启动时读取一次环境变量，之后只读
+API_PROVIDER = "openai"
+API_MODEL = "gpt-4.1-mini"
+API_KEY = os.environ.get("OPENAI_API_KEY", "")
+
+API_CONFIG = MappingProxyType({
+    "provider": API_PROVIDER,
+    "model": API_MODEL,
+    "api_key": API_KEY
+})
@@ -5,14 +5,23 @@
 """
 
 from flask import Flask, jsonify, render_template, request
+from flask.json.provider import DefaultJSONProvider
 import random
 import time
+from itertools import islice
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
 
 from config import API_CONFIG
 from rule_engine import RULE_ENGINE
 from agents import (
     SYSTEM_STATE, PERSONA_INDEX, EVENT_BUS, CENTRAL_AGENT, PERIPHERAL_AGENTS,
-    GENERATED_USER_PERSONAS, reset_system as reset_agents_system
+    GENERATED_USER_PERSONAS, refresh_persona_buckets, refresh_persona_names,
+    reset_system as reset_agents_system
 )
 from attack_knowledge_v2 import KNOWLEDGE_STORE
 
@@ -24,6 +33,29 @@ from battle import (
 
 app = Flask(__name__)
 
+
+class OrjsonProvider(DefaultJSONProvider):
+    """用 orjson 序列化接口响应（事件流、对抗历史里有大量中文和嵌套字典）"""
+
+    def dumps(self, obj, **kwargs):
+        # 与 DefaultJSONProvider 输出同样的键顺序：sort_keys 时字典键排序，dataclass 交给
+        # default 转成字典后一起排序（orjson 不给 dataclass 字段排序）；debug 下 response() 传入 indent 时缩进。
+        # ensure_ascii 等其余 json.dumps 参数 orjson 不支持，中文按 UTF-8 原样输出
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATACLASS
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=kwargs.get("default", self.default), option=option).decode()
+
+    def loads(self, s, **kwargs):
+        # orjson.loads 不接受 object_hook 等参数；本应用只用默认解析
+        return orjson.loads(s)
+
+
+if HAS_ORJSON:
+    app.json = OrjsonProvider(app)
+
 # ============================================================================
 # 全局配置
 # ============================================================================
@@ -45,6 +77,13 @@ COMMUNITY_CONFIG = {
     "version": "v2.7.0"
 }
 
+# 允许通过 /agent/<id>/config 修改的 persona 字段（按顺序遍历，模块级常量只建一次）
+UPDATEABLE_PERSONA_FIELDS = (
+    "name", "category", "description", "skill_level", "stealth_rating",
+    "behavior_patterns", "background", "core_ability", "attack_strategy",
+    "variant_instructions", "chain_of_thought", "output_requirements"
+)
+
 # ============================================================================
 # API路由
 # ============================================================================
@@ -89,18 +128,18 @@ def set_rules():
     CENTRAL_AGENT.refine_rules(rules)
     
     # 将LLM拆解出的变体也同步到规则引擎的自定义词库
+    # （每条规则的变体收集齐后一次性添加，索引每条规则只重建一次）
     for rule_id, standard in CENTRAL_AGENT.refined_standards.items():
         refined = standard.get("refined", {})
+        rule_variants = []
         for variant_type in ["text_variants", "semantic_bypass"]:
             variants_dict = refined.get(variant_type, {})
             if isinstance(variants_dict, dict):
                 for vtype, vlist in variants_dict.items():
                     if isinstance(vlist, list):
-                        for v in vlist:
-                            if v and len(v) >= 2:
-                                RULE_ENGINE.add_custom_variants(
-                                    standard.get("original_rule", rule_id), [v]
-                                )
+                        rule_variants.extend(v for v in vlist if v and len(v) >= 2)
+        if rule_variants:
+            RULE_ENGINE.add_custom_variants(standard.get("original_rule", rule_id), rule_variants)
     
     return jsonify({
         "status": "ok",
@@ -143,11 +182,12 @@ def run_iteration():
     persona_id = data.get("persona_id", "")
     target_keyword = data.get("target_keyword")
     max_iterations = data.get("max_iterations", 3)
+    speculative = bool(data.get("speculative", False))
     
     if not persona_id:
         return jsonify({"error": "缺少persona_id"}), 400
     
-    result = run_iterative_optimization(persona_id, target_keyword, max_iterations)
+    result = run_iterative_optimization(persona_id, target_keyword, max_iterations, speculative=speculative)
     return jsonify(result)
 
 
@@ -169,10 +209,16 @@ def run_collaboration():
 def get_battle_history():
     """获取对抗历史"""
     limit = request.args.get("limit", 50, type=int)
-    history = SYSTEM_STATE["battle_history"][-limit:]
+    battle_history = SYSTEM_STATE["battle_history"]
+    # deque 不支持切片，从尾部倒序取最近 limit 条
+    if limit > 0:
+        history = list(islice(reversed(battle_history), limit))
+        history.reverse()
+    else:
+        history = list(battle_history)
     return jsonify({
         "history": history,
-        "total_count": len(SYSTEM_STATE["battle_history"]),
+        "total_count": len(battle_history),
     })
 
 
@@ -207,20 +253,19 @@ def update_agent_config(persona_id: str):
         return jsonify({"error": "无效的配置数据"}), 400
     
     # 更新persona的字段
-    updateable_fields = [
-        "name", "category", "description", "skill_level", "stealth_rating",
-        "behavior_patterns", "background", "core_ability", "attack_strategy",
-        "variant_instructions", "chain_of_thought", "output_requirements"
-    ]
-    
-    for field in updateable_fields:
+    for field in UPDATEABLE_PERSONA_FIELDS:
         if field in config:
             persona[field] = config[field]
     
+    if "category" in config:
+        refresh_persona_buckets()
+    if "name" in config:
+        refresh_persona_names()
+    
     return jsonify({
         "success": True,
         "message": f"Agent {persona.get('name', persona_id)} 配置已更新",
-        "updated_fields": [f for f in updateable_fields if f in config]
+        "updated_fields": [f for f in UPDATEABLE_PERSONA_FIELDS if f in config]
     })
 
 